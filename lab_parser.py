@@ -0,0 +1,137 @@
+"""Lab test extraction from OCR text lines.
+
+Kept free of the web and OCR stack and fully annotated so it can be
+compiled with mypyc (``mypyc lab_parser.py``). main.py imports it the same
+way whether or not the compiled extension is present.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import re
+
+try:
+    import re2  # type: ignore
+except ImportError:
+    re2 = None  # type: ignore
+
+def _compile_pattern(pattern: str) -> Any:
+    # re2 matches in linear time, so long OCR runs can't backtrack catastrophically
+    if re2 is not None:
+        try:
+            return re2.compile(pattern)
+        except re2.error:
+            pass
+    return re.compile(pattern)
+
+_LAB_PATTERN = _compile_pattern(
+    r"(?P<n1>[A-Za-z\s\(\)]+):\s*(?P<v1>[0-9\.]+)\s*(?P<u1>[a-zA-Z/%]+)?\s*\((?P<lo1>[0-9\.]+)\s*-\s*(?P<hi1>[0-9\.]+)\)"
+    r"|"
+    r"(?P<n2>[A-Za-z\s\(\)]+)\s+(?P<v2>[0-9\.]+)\s+(?P<u2>[a-zA-Z/%]+)\s+(?P<lo2>[0-9\.]+)\s*-\s*(?P<hi2>[0-9\.]+)"
+)
+
+DIGITS = frozenset("0123456789")
+NUMBER_CHARS = frozenset("0123456789.")
+
+def _is_number(s: str) -> bool:
+    return s != "." and s.count(".") <= 1 and NUMBER_CHARS.issuperset(s)
+
+def make_lab_test(
+    test_name: str, test_value: str, test_unit: str, min_range: str, max_range: str
+) -> Optional[Dict[str, Any]]:
+    # Anything that is not a plain decimal (a bare dot, several dots, stray
+    # characters from a split column) is rejected before float parsing
+    if not (test_value and min_range and max_range):
+        return None
+    if not (_is_number(test_value) and _is_number(min_range) and _is_number(max_range)):
+        return None
+
+    value_float = float(test_value)
+    min_float = float(min_range)
+    max_float = float(max_range)
+
+    return {
+        "test_name": test_name,
+        "test_value": test_value,
+        "bio_reference_range": f"{min_float}-{max_float}",
+        "test_unit": test_unit,
+        "lab_test_out_of_range": not (min_float <= value_float <= max_float)
+    }
+
+# Reports from known labs print results as fixed table columns. EasyOCR
+# returns each column cell as its own text box, in reading order, so a row
+# is rebuilt from consecutive results instead of matching the generic regex.
+def _parse_row(cells: List[str], columns: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+    if len(cells) != len(columns):
+        return None
+    fields = dict(zip(columns, (cell.strip() for cell in cells)))
+    min_range, sep, max_range = fields["range"].partition("-")
+    if not sep or not any(c.isalpha() for c in fields["name"]):
+        return None
+    return make_lab_test(
+        fields["name"], fields["value"], fields.get("unit", ""), min_range.strip(), max_range.strip()
+    )
+
+def _match_row(
+    items: List[str], start: int, columns: Tuple[str, ...]
+) -> Tuple[Optional[Dict[str, Any]], int]:
+    # Rows without a unit are one cell short. If the cell after a full-width
+    # window is a number, the window's last cell was really the next row's
+    # name, so only the unitless reading is tried.
+    end = start + len(columns)
+    if end >= len(items) or not _is_number(items[end].strip()):
+        lab_test = _parse_row(items[start:end], columns)
+        if lab_test is not None:
+            return lab_test, len(columns)
+
+    unitless = tuple(column for column in columns if column != "unit")
+    return _parse_row(items[start:start + len(unitless)], unitless), len(unitless)
+
+TEMPLATE_KEYWORDS = (
+    ("thyrocare", "thyrocare"),
+    ("srl diagnostics", "srl"),
+)
+
+# Column order of a result row, as printed by each lab
+TEMPLATE_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "thyrocare": ("name", "value", "unit", "range"),
+    "srl": ("name", "value", "range", "unit"),
+}
+
+def detect_template(text_results: List[str]) -> Optional[str]:
+    for line in text_results:
+        lowered = line.lower()
+        for keyword, template in TEMPLATE_KEYWORDS:
+            if keyword in lowered:
+                return template
+    return None
+
+def extract_lab_tests(text_results: List[str]) -> List[Dict[str, Any]]:
+    lab_tests: List[Dict[str, Any]] = []
+    template = detect_template(text_results)
+    columns = TEMPLATE_COLUMNS.get(template) if template is not None else None
+
+    i = 0
+    while i < len(text_results):
+        if columns is not None:
+            lab_test, width = _match_row(text_results, i, columns)
+            if lab_test is not None:
+                lab_tests.append(lab_test)
+                i += width
+                continue
+
+        line = text_results[i]
+        i += 1
+
+        # Both patterns need a numeric range, so skip headers, names and footers
+        if "-" not in line or DIGITS.isdisjoint(line):
+            continue
+
+        for m in _LAB_PATTERN.finditer(line):
+            if m.group("n1") is not None:
+                match = m.group("n1", "v1", "u1", "lo1", "hi1")
+            else:
+                match = m.group("n2", "v2", "u2", "lo2", "hi2")
+
+            lab_test = make_lab_test(match[0].strip(), match[1], match[2] or "", match[3], match[4])
+            if lab_test is not None:
+                lab_tests.append(lab_test)
+    
+    return lab_tests
@@ -1,13 +1,38 @@
 from fastapi import FastAPI, File, UploadFile, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List
 import easyocr
+import torch
 import cv2
 import numpy as np
-import re
 import os
+import asyncio
+import queue
+import threading
+import time
+import hashlib
+import math
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 import uvicorn
+
+from lab_parser import extract_lab_tests
+
+try:
+    import pyvips
+except (ImportError, OSError):
+    pyvips = None
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# Response schema for the OpenAPI docs only. It is declared through the
+# route's responses= rather than response_model, so the plain dicts built by
+# extract_lab_tests are returned without per-match validation.
 class LabTest(BaseModel):
     test_name: str
     test_value: str
@@ -15,66 +40,332 @@ class LabTest(BaseModel):
     test_unit: str
     lab_test_out_of_range: bool
 
-app = FastAPI(title="Lab Test Extraction API")
+class LabTestResponse(BaseModel):
+    is_success: bool
+    recognized_text: List[str]
+    data: List[LabTest]
 
-reader = easyocr.Reader(['en'])
+app = FastAPI(title="Lab Test Extraction API", default_response_class=ORJSONResponse)
 
-def preprocess_image(image_bytes):
+# Detection cost grows with pixel count, so large photos are downscaled to
+# this long side before OCR.
+MAX_IMAGE_SIDE = 1600
+
+# Requests are grouped into one readtext_batched call once OCR_BATCH_SIZE
+# images are queued or OCR_BATCH_TIMEOUT seconds pass, whichever comes first.
+# Each image is padded, not stretched, to the largest page in its batch
+# (rounded up to CRAFT's 32 px stride), so a lone small upload stays small.
+OCR_BATCH_SIZE = 8
+OCR_BATCH_TIMEOUT = 0.02
+OCR_BATCH_WIDTH = MAX_IMAGE_SIDE
+OCR_BATCH_HEIGHT = MAX_IMAGE_SIDE
+OCR_BATCH_ALIGN = 32
+
+# Setting OCR_ONNX_DIR exports the detector and recognizer to ONNX there and
+# runs them through ONNX Runtime (TensorRT FP16 / CUDA / CPU) instead of
+# eager PyTorch. Exports and TensorRT engines are reused across restarts.
+ONNX_MODEL_DIR = os.environ.get("OCR_ONNX_DIR")
+use_onnx = bool(ONNX_MODEL_DIR) and ort is not None
+
+# EasyOCR dynamically quantizes the CPU recognizer by default, and quantized
+# LSTM/Linear ops cannot be exported to ONNX.
+reader = easyocr.Reader(['en'], cudnn_benchmark=True, quantize=not use_onnx)
+
+use_cuda = str(reader.device).startswith("cuda")
+
+# The recognizer sees one 64 px high crop per text box, padded to the widest
+# crop in its batch. The TensorRT profile covers full-width boxes down to
+# 16 px tall so engines are built once instead of per new crop width.
+RECOGNIZER_HEIGHT = 64
+RECOGNIZER_OPT_WIDTH = 512
+RECOGNIZER_MAX_WIDTH = RECOGNIZER_HEIGHT * math.ceil(OCR_BATCH_WIDTH / 16)
+
+class OnnxModel:
+    """Drop-in for an EasyOCR torch model backed by an ONNX Runtime session."""
+
+    def __init__(self, path, providers):
+        self.session = ort.InferenceSession(path, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_names = [output.name for output in self.session.get_outputs()]
+
+    def eval(self):
+        return self
+
+    def __call__(self, x, *args):
+        x = x.detach().float().contiguous()
+        if x.is_cuda:
+            # EasyOCR already put the input on the GPU, so bind it in place and
+            # keep outputs on the device until the single copy back to the host.
+            # EasyOCR moves model outputs to the CPU itself right after this.
+            device_id = x.device.index or 0
+            binding = self.session.io_binding()
+            binding.bind_input(
+                self.input_name, device_type="cuda", device_id=device_id,
+                element_type=np.float32, shape=tuple(x.shape), buffer_ptr=x.data_ptr()
+            )
+            for name in self.output_names:
+                binding.bind_output(name, device_type="cuda", device_id=device_id)
+            self.session.run_with_iobinding(binding)
+            outputs = binding.copy_outputs_to_cpu()
+        else:
+            outputs = self.session.run(None, {self.input_name: x.numpy()})
+
+        tensors = tuple(torch.from_numpy(output) for output in outputs)
+        return tensors[0] if len(tensors) == 1 else tensors
+
+def export_onnx(model, args, path, dynamic_axes):
+    if os.path.exists(path):
+        return
+    model = getattr(model, "module", model)
+    with torch.no_grad():
+        torch.onnx.export(
+            model.eval(), args, path,
+            opset_version=17,
+            input_names=["input"],
+            dynamic_axes=dynamic_axes
+        )
+
+def trt_shape(*dims):
+    return "input:" + "x".join(str(dim) for dim in dims)
+
+def onnx_providers(profile):
+    if not use_cuda:
+        return ["CPUExecutionProvider"]
+
+    min_shape, opt_shape, max_shape = profile
+    return [
+        ("TensorrtExecutionProvider", {
+            "trt_fp16_enable": True,
+            "trt_engine_cache_enable": True,
+            "trt_engine_cache_path": ONNX_MODEL_DIR,
+            "trt_profile_min_shapes": min_shape,
+            "trt_profile_opt_shapes": opt_shape,
+            "trt_profile_max_shapes": max_shape
+        }),
+        "CUDAExecutionProvider",
+        "CPUExecutionProvider"
+    ]
+
+def load_onnx_models():
+    os.makedirs(ONNX_MODEL_DIR, exist_ok=True)
+    detector_path = os.path.join(ONNX_MODEL_DIR, "craft.onnx")
+    recognizer_path = os.path.join(ONNX_MODEL_DIR, "recognizer.onnx")
+
+    export_onnx(
+        reader.detector,
+        (torch.zeros(1, 3, 640, 640, device=reader.device),),
+        detector_path,
+        {"input": {0: "batch", 2: "height", 3: "width"}}
+    )
+    # The recognizer's second forward argument (text) is unused at inference
+    export_onnx(
+        reader.recognizer,
+        (
+            torch.zeros(1, 1, RECOGNIZER_HEIGHT, RECOGNIZER_OPT_WIDTH, device=reader.device),
+            torch.zeros(1, 1, dtype=torch.long, device=reader.device)
+        ),
+        recognizer_path,
+        {"input": {0: "batch", 3: "width"}}
+    )
+
+    # Batches are padded to their largest page, anywhere from one stride up
+    # to a full slot
+    detector_profile = (
+        trt_shape(1, 3, OCR_BATCH_ALIGN, OCR_BATCH_ALIGN),
+        trt_shape(1, 3, OCR_BATCH_HEIGHT, OCR_BATCH_WIDTH),
+        trt_shape(OCR_BATCH_SIZE, 3, OCR_BATCH_HEIGHT, OCR_BATCH_WIDTH)
+    )
+    recognizer_profile = (
+        trt_shape(1, 1, RECOGNIZER_HEIGHT, RECOGNIZER_HEIGHT),
+        trt_shape(1, 1, RECOGNIZER_HEIGHT, RECOGNIZER_OPT_WIDTH),
+        trt_shape(OCR_BATCH_SIZE, 1, RECOGNIZER_HEIGHT, RECOGNIZER_MAX_WIDTH)
+    )
+
+    reader.detector = OnnxModel(detector_path, onnx_providers(detector_profile))
+    reader.recognizer = OnnxModel(recognizer_path, onnx_providers(recognizer_profile))
+
+class Float16Model(torch.nn.Module):
+    """Runs an EasyOCR model under FP16 autocast but hands back float32 outputs,
+    since EasyOCR feeds them to numpy/OpenCV code that rejects float16."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, *args):
+        with torch.autocast(device_type="cuda", dtype=torch.float16):
+            outputs = self.model(*args)
+        if isinstance(outputs, tuple):
+            return tuple(output.float() for output in outputs)
+        return outputs.float()
+
+# Otherwise, on GPU both models run under FP16 autocast. On CPU EasyOCR
+# already quantizes the recognizer to INT8 (Reader's quantize=True default).
+if use_onnx:
+    load_onnx_models()
+elif use_cuda:
+    reader.detector = Float16Model(reader.detector)
+    reader.recognizer = Float16Model(reader.recognizer)
+
+# Reused padding target for batch slots. readtext_batched still makes its own
+# BGR copy of every slot. The buffer is not pinned, because EasyOCR never
+# copies from it to the GPU. Only the OCR thread touches it.
+ocr_staging = np.empty(OCR_BATCH_SIZE * OCR_BATCH_HEIGHT * OCR_BATCH_WIDTH, dtype=np.uint8)
+
+# Preprocessing, OCR and post-processing run as separate pipeline stages so
+# decoding request N+1 overlaps with OCR of request N. The OCR queue is
+# bounded so preprocessing blocks instead of piling up images in memory.
+# OCR itself stays on a single thread because the EasyOCR torch models are
+# not safe to drive from several threads at once.
+preproc_pool = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="preprocess")
+post_pool = ThreadPoolExecutor(thread_name_prefix="postprocess")
+ocr_queue = queue.Queue(maxsize=OCR_BATCH_SIZE * 4)
+
+def decode_grayscale(image_bytes):
+    if pyvips is not None:
+        # libvips shrinks on load, so large JPEGs are never decoded at full size
+        image = pyvips.Image.thumbnail_buffer(
+            image_bytes, MAX_IMAGE_SIDE, height=MAX_IMAGE_SIDE, size="down"
+        )
+        if image.hasalpha():
+            image = image.flatten(background=255)
+        image = image.colourspace("b-w").cast("uchar")
+        return np.ndarray(
+            buffer=image.write_to_memory(),
+            dtype=np.uint8,
+            shape=[image.height, image.width]
+        )
 
     nparr = np.frombuffer(image_bytes, np.uint8)
 
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    gray = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+
+    h, w = gray.shape
+    scale = MAX_IMAGE_SIDE / max(h, w)
+    if scale < 1:
+        gray = cv2.resize(
+            gray, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA
+        )
+
+    return gray
+
+def preprocess_image(image_bytes):
 
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray = decode_grayscale(image_bytes)
     
 
     binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
                                   cv2.THRESH_BINARY, 11, 2)
     
-    kernel = np.ones((1, 1), np.uint8)
-    opening = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel, iterations=1)
-    
-    return opening
+    return binary
 
-def extract_lab_tests(text_results):
-    lab_tests = []
+def _round_up(n, multiple):
+    return -(-n // multiple) * multiple
 
-    patterns = [
-        r"([A-Za-z\s\(\)]+):\s*([0-9\.]+)\s*([a-zA-Z/%]+)?\s*\(([0-9\.]+)\s*-\s*([0-9\.]+)\)",
+def run_ocr_batch(images):
+    fitted = []
+    for img in images:
+        h, w = img.shape
+        scale = min(OCR_BATCH_WIDTH / w, OCR_BATCH_HEIGHT / h)
+        if scale < 1:
+            img = cv2.resize(
+                img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA
+            )
+        fitted.append(img)
 
-        r"([A-Za-z\s\(\)]+)\s+([0-9\.]+)\s+([a-zA-Z/%]+)\s+([0-9\.]+)\s*-\s*([0-9\.]+)"
-    ]
-    
-    for line in text_results:
-        for pattern in patterns:
-            matches = re.findall(pattern, line)
-            for match in matches:
-                test_name = match[0].strip()
-                test_value = match[1].strip()
-                test_unit = match[2].strip() if match[2] else ""
-                min_range = float(match[3].strip())
-                max_range = float(match[4].strip())
-                
-                bio_reference_range = f"{min_range}-{max_range}"
-                
+    height = _round_up(max(img.shape[0] for img in fitted), OCR_BATCH_ALIGN)
+    width = _round_up(max(img.shape[1] for img in fitted), OCR_BATCH_ALIGN)
+    # A contiguous (n, height, width) view over the front of the staging buffer
+    slots = ocr_staging[:len(fitted) * height * width].reshape(len(fitted), height, width)
+    for slot, img in zip(slots, fitted):
+        h, w = img.shape
+        slot.fill(255)
+        slot[:h, :w] = img
 
-                try:
-                    value_float = float(test_value)
-                    lab_test_out_of_range = value_float < min_range or value_float > max_range
-                except ValueError:
-                    lab_test_out_of_range = False
-                
-                lab_tests.append(
-                    LabTest(
-                        test_name=test_name,
-                        test_value=test_value,
-                        bio_reference_range=bio_reference_range,
-                        test_unit=test_unit,
-                        lab_test_out_of_range=lab_test_out_of_range
-                    )
-                )
-    
-    return lab_tests
+    return reader.readtext_batched(list(slots), detail=0)
+
+def ocr_worker():
+    while True:
+        batch = [ocr_queue.get()]
+        deadline = time.monotonic() + OCR_BATCH_TIMEOUT
+        while len(batch) < OCR_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(ocr_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        batch = [(img, future) for img, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            continue
+
+        try:
+            results = run_ocr_batch([img for img, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            continue
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+def preprocess_and_enqueue(image_bytes):
+    future = Future()
+    ocr_queue.put((preprocess_image(image_bytes), future))
+    return future
+
+@app.on_event("startup")
+async def start_ocr_worker():
+    # Warm up with text on the page so the recognizer runs too. On GPU the
+    # first inferences also pay for lazy CUDA init and cuDNN autotuning, so
+    # both the full-batch and lone-request shapes are primed there. CPU has
+    # nothing to autotune, so one page is enough.
+    dummy = np.full((OCR_BATCH_HEIGHT, OCR_BATCH_WIDTH), 255, dtype=np.uint8)
+    cv2.putText(dummy, "Hemoglobin 13.5 g/dL 12.0 - 16.0", (50, 200),
+                cv2.FONT_HERSHEY_SIMPLEX, 1.5, 0, 3)
+    if use_cuda:
+        for _ in range(2):
+            run_ocr_batch([dummy] * OCR_BATCH_SIZE)
+            run_ocr_batch([dummy])
+    else:
+        run_ocr_batch([dummy])
+
+    threading.Thread(target=ocr_worker, name="ocr", daemon=True).start()
+
+# Responses for recently seen images, keyed by a hash of the upload, so
+# retries and polling clients skip OCR entirely. Only used from the event loop.
+RESULT_CACHE_SIZE = 1024
+result_cache = OrderedDict()
+
+def cache_result(key, response):
+    result_cache[key] = response
+    if len(result_cache) > RESULT_CACHE_SIZE:
+        result_cache.popitem(last=False)
+
+def fill_buffer(f, view):
+    offset = 0
+    while offset < len(view):
+        n = f.readinto(view[offset:])
+        if not n:
+            break
+        offset += n
+    if offset == len(view) and f.read(1):
+        raise ValueError("Uploaded file is larger than the declared size")
+    return offset
+
+async def read_upload(file, size_hint):
+    # Content-Length covers the whole multipart body, so it is an upper bound
+    # on the file size. The spooled upload (on disk past 1 MB) is read straight
+    # into one buffer in a single threadpool hop.
+    size = file.size if getattr(file, "size", None) is not None else size_hint
+    if size <= 0:
+        return await file.read()
+
+    view = memoryview(bytearray(size))
+    offset = await run_in_threadpool(fill_buffer, file.file, view)
+    return view[:offset]
 
 @app.get("/", response_class=HTMLResponse)
 async def main():
@@ -142,20 +433,29 @@ async def main():
     """
     return HTMLResponse(content=html_content)
 
-@app.post("/get-lab-tests")
-async def get_lab_tests(file: UploadFile = File(...)):
+@app.post("/get-lab-tests", responses={200: {"model": LabTestResponse}})
+async def get_lab_tests(request: Request, file: UploadFile = File(...)):
 
     try:        
-        contents = await file.read()
+        contents = await read_upload(file, int(request.headers.get("content-length", 0)))
+
+        key = hashlib.blake2b(contents, digest_size=16).digest()
+        cached = result_cache.get(key)
+        if cached is not None:
+            result_cache.move_to_end(key)
+            return cached
 
-        processed_img = preprocess_image(contents)
-        results = reader.readtext(processed_img, detail=0)
-        lab_tests = extract_lab_tests(results)
-        return {
+        loop = asyncio.get_running_loop()
+        ocr_future = await loop.run_in_executor(preproc_pool, preprocess_and_enqueue, contents)
+        results = await asyncio.wrap_future(ocr_future)
+        lab_tests = await loop.run_in_executor(post_pool, extract_lab_tests, results)
+        response = {
             "is_success": True,
             "recognized_text": results,  
-            "data": [test.dict() for test in lab_tests]
+            "data": lab_tests
         }
+        cache_result(key, response)
+        return response
     
     except Exception as e:
         return JSONResponse(
@@ -168,9 +468,14 @@ async def get_lab_tests(file: UploadFile = File(...)):
 
 if __name__ == "__main__":
 
+    # Each worker process loads its own EasyOCR models, so workers default to
+    # one; preprocessing already uses every core through preproc_pool.
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=int(os.environ.get("PORT", 8000)),
+        workers=int(os.environ.get("WEB_CONCURRENCY", 1)),
+        loop="uvloop",
+        http="httptools",
         reload=False
     )
@@ -0,0 +1,65 @@
+from lab_parser import extract_lab_tests
+
+
+def test_generic_colon_pattern():
+    tests = extract_lab_tests(["Patient Name", "Hemoglobin: 18.5 g/dL (12.0 - 16.0)"])
+    assert tests == [{
+        "test_name": "Hemoglobin",
+        "test_value": "18.5",
+        "bio_reference_range": "12.0-16.0",
+        "test_unit": "g/dL",
+        "lab_test_out_of_range": True
+    }]
+
+
+def test_generic_skips_malformed_numbers():
+    assert extract_lab_tests(["Glucose 1.2.3 mg/dL 70 - 100"]) == []
+
+
+def test_thyrocare_rows_span_ocr_boxes():
+    # readtext(detail=0) returns one string per table cell, in reading order
+    results = [
+        "THYROCARE", "TEST NAME", "VALUE", "UNITS", "REFERENCE RANGE",
+        "TSH", "6.2", "uIU/mL", "0.3 - 4.5",
+        "Free T4", "1.1", "ng/dL", "0.8-1.8",
+    ]
+    tests = extract_lab_tests(results)
+    assert [(t["test_name"], t["test_unit"], t["lab_test_out_of_range"]) for t in tests] == [
+        ("TSH", "uIU/mL", True),
+        ("Free T4", "ng/dL", False),
+    ]
+
+
+def test_srl_rows_put_range_before_unit():
+    results = ["SRL Diagnostics", "Glucose Fasting", "120", "70 - 100", "mg/dL"]
+    tests = extract_lab_tests(results)
+    assert len(tests) == 1
+    assert tests[0]["bio_reference_range"] == "70.0-100.0"
+    assert tests[0]["test_unit"] == "mg/dL"
+    assert tests[0]["lab_test_out_of_range"] is True
+
+
+def test_srl_row_without_unit_does_not_swallow_next_row():
+    results = [
+        "SRL Diagnostics",
+        "INR", "1.1", "0.8 - 1.2",
+        "Hemoglobin", "13.5", "12.0 - 16.0", "g/dL",
+        "Platelets", "250", "150 - 400", "10^3/uL",
+    ]
+    tests = extract_lab_tests(results)
+    assert [(t["test_name"], t["test_unit"]) for t in tests] == [
+        ("INR", ""),
+        ("Hemoglobin", "g/dL"),
+        ("Platelets", "10^3/uL"),
+    ]
+
+
+def test_thyrocare_row_without_unit():
+    results = ["THYROCARE", "TSH", "2.5", "0.3 - 4.5", "Free T4", "1.1", "ng/dL", "0.8-1.8"]
+    tests = extract_lab_tests(results)
+    assert [(t["test_name"], t["test_unit"]) for t in tests] == [("TSH", ""), ("Free T4", "ng/dL")]
+
+
+def test_template_falls_back_to_generic_pattern():
+    results = ["THYROCARE", "Hemoglobin: 13.5 g/dL (12.0 - 16.0)"]
+    assert [t["test_name"] for t in extract_lab_tests(results)] == ["Hemoglobin"]